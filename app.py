@@ -4,7 +4,6 @@
 # =========================================================
 
 import os
-import shutil
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -15,16 +14,16 @@ from config import Config
 
 # Import utilities
 from utils.rate_limiter import RateLimiter
-from utils.cache_manager import CacheManager
+from utils.cache_manager import CacheManager, link_or_copy
 from utils.error_handler import retry_with_exponential_backoff, ProgressTracker
 from utils.parallel_processor import ParallelSceneProcessor
 from utils.validators import validate_topic
 
 # Import services
 from services.script_generator import generate_script
-from services.image_generator import generate_image_img2img, generate_image_txt2img
-from services.tts_service import generate_audio
-from services.video_assembler import add_subtitles_to_image, create_video_clip, assemble_final_video
+from services.image_generator import generate_image_img2img, generate_image_txt2img, preload_reference_images
+from services.tts_service import generate_audio_async
+from services.video_assembler import create_video_clip, assemble_final_video
 
 # Import models
 from models.character_db import get_character_reference_from_topic
@@ -41,8 +40,22 @@ if not OPENAI_API_KEY or not STABILITY_API_KEY:
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
 # ============ INITIALIZE MANAGERS ============
-rate_limiter = RateLimiter(max_videos_per_day=Config.MAX_VIDEOS_PER_DAY)
-cache_manager = CacheManager(cache_dir=Config.CACHE_DIR)
+# Kept alive across Streamlit reruns so in-memory state (token buckets) persists
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    return RateLimiter(max_videos_per_day=Config.MAX_VIDEOS_PER_DAY)
+
+@st.cache_resource(show_spinner=False)
+def get_cache_manager():
+    return CacheManager(cache_dir=Config.CACHE_DIR)
+
+@st.cache_resource(show_spinner=False)
+def warm_reference_images():
+    preload_reference_images()
+
+rate_limiter = get_rate_limiter()
+cache_manager = get_cache_manager()
+warm_reference_images()
 
 # ============ UI STYLING ============
 st.set_page_config(page_title="Mythos AI Studio", page_icon="🕉️", layout="wide")
@@ -114,7 +127,7 @@ def get_client_ip():
 # ============ WRAPPED FUNCTIONS WITH RETRY ============
 
 @retry_with_exponential_backoff(max_retries=3, initial_delay=2)
-def generate_image_safe(scene_prompt, ref_image_path, scene_index):
+async def generate_image_safe(scene_prompt, ref_image_path, scene_index):
     """Image generation with retry and caching"""
     # Normalize ref_image_path for caching key
     cache_ref = ref_image_path if ref_image_path else "none"
@@ -124,14 +137,14 @@ def generate_image_safe(scene_prompt, ref_image_path, scene_index):
     if cached and os.path.exists(cached):
         st.caption("✅ Using cached image")
         output = f"scene_{scene_index}.png"
-        shutil.copy(cached, output)
+        link_or_copy(cached, output)
         return output
     
     # Generate new image
     if ref_image_path:
-        result = generate_image_img2img(scene_prompt, ref_image_path, scene_index, STABILITY_API_KEY)
+        result = await generate_image_img2img(scene_prompt, ref_image_path, scene_index, STABILITY_API_KEY)
     else:
-        result = generate_image_txt2img(scene_prompt, scene_index, STABILITY_API_KEY)
+        result = await generate_image_txt2img(scene_prompt, scene_index, STABILITY_API_KEY)
     
     # Cache result
     if result:
@@ -140,7 +153,7 @@ def generate_image_safe(scene_prompt, ref_image_path, scene_index):
     return result
 
 @retry_with_exponential_backoff(max_retries=3, initial_delay=1)
-def generate_audio_safe(text, index):
+async def generate_audio_safe(text, index):
     """TTS with retry and caching"""
     from services.tts_service import choose_voice
     
@@ -150,11 +163,11 @@ def generate_audio_safe(text, index):
     cached = cache_manager.get_cached_audio(text, voice)
     if cached and os.path.exists(cached):
         output = f"audio_{index}.mp3"
-        shutil.copy(cached, output)
+        link_or_copy(cached, output)
         return output
     
     # Generate new audio
-    result = generate_audio(text, index)
+    result = await generate_audio_async(text, index)
     
     # Cache result
     if result:
@@ -162,51 +175,94 @@ def generate_audio_safe(text, index):
     
     return result
 
+def prefetch_cached_scenes(script, scene_reference):
+    """
+    Resolve every scene's cached image and audio with one bulk lookup,
+    linking hits into place so they never reach the worker pools.
+    Returns ({index: image_path}, {index: audio_path}).
+    """
+    from services.tts_service import choose_voice
+    
+    image_keys = {}
+    audio_keys = {}
+    for index, scene in enumerate(script):
+        if not isinstance(scene, dict):
+            continue
+        
+        cache_ref = scene_reference(scene) or "none"
+        narration = scene.get("narration", "")
+        image_keys[index] = cache_manager.image_key(scene.get("image_prompt", ""), cache_ref, index)
+        audio_keys[index] = cache_manager.audio_key(narration, choose_voice(narration))
+    
+    found = cache_manager.get_cached_many([*image_keys.values(), *audio_keys.values()])
+    
+    cached_images = {}
+    for index, key in image_keys.items():
+        if key in found:
+            cached_images[index] = f"scene_{index}.png"
+            link_or_copy(found[key], cached_images[index])
+    
+    cached_audio = {}
+    for index, key in audio_keys.items():
+        if key in found:
+            cached_audio[index] = f"audio_{index}.mp3"
+            link_or_copy(found[key], cached_audio[index])
+    
+    if cached_images or cached_audio:
+        st.caption(f"✅ Using cached assets: {len(cached_images)} images, {len(cached_audio)} audio")
+    
+    return cached_images, cached_audio
+
 # ============ VIDEO CREATION (PARALLEL) ============
 
 def create_video_parallel(script, topic):
-    """Create video with parallel scene generation"""
+    """Create video with concurrent scene generation"""
     
-    processor = ParallelSceneProcessor(max_workers=Config.MAX_WORKERS)
+    processor = ParallelSceneProcessor(
+        max_image_concurrency=Config.MAX_IMAGE_CONCURRENCY,
+        max_audio_concurrency=Config.MAX_AUDIO_CONCURRENCY
+    )
     
     progress_bar = st.progress(0)
     status_container = st.empty()
     
     status_container.markdown("🚀 **Generating scenes in parallel...**")
     
+    def scene_reference(scene):
+        return get_character_reference_from_topic(scene.get("image_prompt", "")) or \
+               get_character_reference_from_topic(scene.get("narration", "")) or \
+               get_character_reference_from_topic(topic)
+    
     # Wrapper functions for parallel processing
-    def image_wrapper(scene, index):
+    async def image_wrapper(scene, index):
         visual_desc = scene.get("image_prompt", "")
-        ref_path = get_character_reference_from_topic(visual_desc) or \
-                   get_character_reference_from_topic(scene.get("narration", "")) or \
-                   get_character_reference_from_topic(topic)
-        
-        return generate_image_safe(visual_desc, ref_path, index)
+        return await generate_image_safe(visual_desc, scene_reference(scene), index)
     
-    def audio_wrapper(scene, index):
+    async def audio_wrapper(scene, index):
         narration = scene.get("narration", "")
-        return generate_audio_safe(narration, index)
+        return await generate_audio_safe(narration, index)
     
-    # Process all scenes in parallel
-    results = processor.process_scenes_parallel(script, image_wrapper, audio_wrapper)
+    cached_images, cached_audio = prefetch_cached_scenes(script, scene_reference)
     
-    # Build clips
-    clips = []
-    success_count = 0
+    # Build clips as scenes finish, while later scenes are still generating
+    clips = {}
+    completed = 0
     
-    for scene_index, img_file, audio_file in results:
+    for scene_index, img_file, audio_file in processor.process_scenes_parallel(
+        script, image_wrapper, audio_wrapper, cached_images, cached_audio
+    ):
         if img_file and audio_file:
             narration = script[scene_index].get("narration", "")
-            img_with_sub = add_subtitles_to_image(img_file, narration)
             
             try:
-                clip = create_video_clip(img_with_sub, audio_file)
-                clips.append(clip)
-                success_count += 1
+                clips[scene_index] = create_video_clip(img_file, audio_file, narration, scene_index)
             except Exception as e:
                 st.warning(f"⚠️ Scene {scene_index + 1} clip failed: {str(e)}")
         
-        progress_bar.progress((scene_index + 1) / len(script))
+        completed += 1
+        progress_bar.progress(completed / len(script))
+    
+    success_count = len(clips)
     
     if success_count == 0:
         st.error("❌ No scenes generated successfully")
@@ -216,28 +272,34 @@ def create_video_parallel(script, topic):
     
     # Assemble video
     status_container.markdown("✨ **Assembling final masterpiece...**")
-    return assemble_final_video(clips)
+    return assemble_final_video([clips[i] for i in sorted(clips)])
 
 # ============ ANALYTICS DASHBOARD ============
 
+@st.cache_data(ttl=30, show_spinner=False)
+def get_dashboard_stats():
+    """Usage and cache stats, refreshed at most every 30 seconds"""
+    return rate_limiter.get_stats(), cache_manager.get_cache_stats()
+
 def show_analytics():
     """Display analytics in sidebar"""
     st.sidebar.markdown("---")
     st.sidebar.subheader("📊 Analytics")
     
+    stats, cache_stats = get_dashboard_stats()
+    
     # Rate limiter stats
-    stats = rate_limiter.get_stats()
     st.sidebar.metric("Users Today", stats["unique_users_today"])
     st.sidebar.metric("Videos Today", stats["total_videos_today"])
     
     # Cache stats
-    cache_stats = cache_manager.get_cache_stats()
     st.sidebar.metric("Cached Images", cache_stats["total_images"])
     st.sidebar.metric("Cached Audio", cache_stats["total_audio"])
     st.sidebar.metric("Cache Size (MB)", cache_stats["cache_size_mb"])
     
     if st.sidebar.button("🗑️ Clear Cache"):
         cache_manager.clear_cache()
+        get_dashboard_stats.clear()
         st.sidebar.success("Cache cleared!")
 
 # ============ MAIN UI ============
@@ -328,14 +390,25 @@ if st.button("🚀 Create Epic Video", use_container_width=True):
         st.error(f"❌ internal error: Generated script is not a list of scenes. Got: {type(script)}")
         st.stop()
 
+    # Reserve a slot atomically, so two sessions can't both pass the check above
+    granted, used_count, _ = rate_limiter.reserve(user_key)
+    if not granted:
+        st.error(f"🚫 **Daily Limit Reached!**")
+        st.stop()
+    
     # Create video
-    video_path = create_video_parallel(script, topic)
+    video_path = None
+    try:
+        video_path = create_video_parallel(script, topic)
+    except Exception as e:
+        st.warning(f"⚠️ {str(e)}")
+    finally:
+        # Give the reserved slot back on every path that produced no video
+        if not (video_path and os.path.exists(video_path)):
+            rate_limiter.release(user_key)
     
     if video_path and os.path.exists(video_path):
-        # Increment usage
-        rate_limiter.increment_usage(user_key)
-        
-        st.success(f"✅ Video created! ({current_count + 1}/{Config.MAX_VIDEOS_PER_DAY} used today)")
+        st.success(f"✅ Video created! ({used_count}/{Config.MAX_VIDEOS_PER_DAY} used today)")
         st.video(video_path)
         
         with open(video_path, "rb") as f:
@@ -2,6 +2,9 @@
 # Mythos AI Studio - Configuration
 # =========================================================
 
+import os
+from types import MappingProxyType
+
 class Config:
     # Rate Limiting
     MAX_VIDEOS_PER_DAY = 3
@@ -19,12 +22,19 @@ class Config:
     DEFAULT_STEPS = "40"
     DEFAULT_SAMPLER = "K_DPMPP_2M"
     
+    # Video Settings (every scene is scaled/padded to this frame; even sizes only)
+    VIDEO_WIDTH = 1024
+    VIDEO_HEIGHT = 1024
+    
     # Subtitle Settings
     SUBTITLE_FONT_SIZE = 40
-    SUBTITLE_MAX_WIDTH = 50
+    SUBTITLE_MARGIN = 60  # Pixels kept clear on each side of a subtitle line
     
     # Parallel Processing
-    MAX_WORKERS = 2  # Number of concurrent scene generations
+    MAX_IMAGE_CONCURRENCY = 4  # Concurrent Stability calls (API rate limits)
+    MAX_AUDIO_CONCURRENCY = 8  # Concurrent edge-tts calls
+    TTS_CONNECTIONS_PER_VOICE = 2  # Reused edge-tts sockets per voice (requests queue for one)
+    TTS_REQUEST_TIMEOUT = 30  # Seconds per request, counted once a socket is held
     
     # Paths
     CACHE_DIR = "cache"
@@ -39,8 +49,8 @@ class Config:
         "close-up divine portrait, intense expression, detailed facial features"
     ]
     
-    # Character Mapping
-    CHARACTER_MAP = {
+    # Character Mapping (raw aliases; see CHARACTER_MAP below)
+    _RAW_CHARACTER_MAP = {
         # Shiva variations
         "shiva": "characters/Shiva.png",
         "mahadev": "characters/Shiva.png",
@@ -65,4 +75,21 @@ class Config:
         "ram": "characters/Rama.png",
         "raghav": "characters/Rama.png",
         "raghunath": "characters/Rama.png",
-    }
\ No newline at end of file
+    }
+    
+    @classmethod
+    def _build_character_map(cls):
+        """Resolve each reference image once to an absolute path, dropping missing files"""
+        resolved = {
+            path: os.path.abspath(path)
+            for path in set(cls._RAW_CHARACTER_MAP.values())
+            if os.path.exists(path)
+        }
+        return MappingProxyType({
+            alias: resolved[path]
+            for alias, path in cls._RAW_CHARACTER_MAP.items()
+            if path in resolved
+        })
+
+# Alias -> absolute path of an existing reference image, frozen at import
+Config.CHARACTER_MAP = Config._build_character_map()
\ No newline at end of file
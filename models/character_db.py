@@ -2,9 +2,24 @@
 # Character Database - God-Specific Attributes
 # =========================================================
 
-import os
+import re
+from functools import lru_cache
 from config import Config
 
+# Find every character alias in a single pass over the text. The lookahead
+# reports overlapping matches ("dramatic" contains "ram" before "hanuman"),
+# and at each position the alternation picks the alias that comes first
+# in CHARACTER_MAP - so the lowest rank found is what the old loop returned.
+# "(?!)" never matches, for when no reference images are installed
+_CHARACTER_RANK = {key: rank for rank, key in enumerate(Config.CHARACTER_MAP)}
+_CHARACTER_RE = re.compile("(?=(" + ("|".join(
+    re.escape(key) for key in Config.CHARACTER_MAP
+) or "(?!)") + "))")
+
+# If text mentions multiple characters, use txt2img instead
+_MULTI_CHAR_RE = re.compile(r" and | with | along with |,")
+
+@lru_cache(maxsize=64)
 def get_character_attributes(god_name):
     """Get god-specific visual attributes for enhanced prompting"""
     gn = god_name.lower()
@@ -63,15 +78,12 @@ def get_character_reference_from_topic(text):
     
     t = text.lower()
     
-    # If mentions multiple characters, use txt2img instead
-    multi_char_indicators = [" and ", " with ", " along with ", ","]
-    if any(indicator in t for indicator in multi_char_indicators):
+    if _MULTI_CHAR_RE.search(t):
         return None
     
-    # Find matching character
-    for key, filepath in Config.CHARACTER_MAP.items():
-        if key in t:
-            if os.path.exists(filepath):
-                return filepath
+    # Find matching character (CHARACTER_MAP only holds existing files)
+    found = [match.group(1) for match in _CHARACTER_RE.finditer(t)]
+    if found:
+        return Config.CHARACTER_MAP[min(found, key=_CHARACTER_RANK.__getitem__)]
     
     return None
\ No newline at end of file
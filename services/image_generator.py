@@ -4,62 +4,120 @@
 
 import os
 import io
-import base64
-import requests
+import httpx
+import logging
 import PIL.Image
-import PIL.ImageEnhance
+from functools import lru_cache
 from config import Config
 from models.character_db import get_character_attributes
 
+logger = logging.getLogger(__name__)
+
+# Shared across all Stability calls: concurrent scenes are multiplexed as
+# HTTP/2 streams over the same TLS connection.
+# Created lazily because it must live on the event loop that uses it.
+_CLIENT = None
+
+def _get_client():
+    """Return the shared HTTP/2 client"""
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=Config.MAX_IMAGE_CONCURRENCY,
+                max_keepalive_connections=Config.MAX_IMAGE_CONCURRENCY
+            ),
+            timeout=90
+        )
+    return _CLIENT
+
+# Quality enhancement tokens
+QUALITY_TOKENS = """
+masterpiece, best quality, ultra detailed, 8k uhd, photorealistic,
+professionally lit, volumetric lighting, ray tracing,
+epic cinematic composition, award-winning photography,
+intricate details, sharp focus, depth of field
+""".strip()
+
+# Style consistency
+STYLE_TOKENS = """
+in style of Raja Ravi Varma classical Indian art,
+divine mythological painting, sacred traditional art,
+culturally authentic, spiritual essence
+""".strip()
+
+# Strong negative prompt
+NEGATIVE_PROMPT = """
+cartoon, anime, sketch, illustration, cgi, 3d render,
+low quality, blurry, distorted, disfigured, bad anatomy,
+multiple heads, deformed body, ugly face, bad proportions,
+modern clothing, sunglasses, phones, cars, buildings, technology,
+text, watermark, signature, logo, brand names,
+western symbols, crosses, churches,
+violence, blood, gore, weapons in aggressive use,
+extra limbs, missing limbs, cloned face, malformed
+""".strip()
+
+@lru_cache(maxsize=32)
+def _positive_prompt_template(god_name, camera_angle):
+    """Scene-independent prompt text before and after the scene description"""
+    attributes = get_character_attributes(god_name).strip()
+    
+    prefix = f"{god_name}, maintaining exact same facial features as reference,\n"
+    suffix = f""",
+{camera_angle},
+{attributes},
+ancient sacred Indian mythological setting,
+divine temple or natural spiritual environment,
+{QUALITY_TOKENS},
+{STYLE_TOKENS}"""
+    
+    return prefix, suffix
+
 def build_enhanced_prompt(god_name, scene_description, camera_angle):
     """Build optimized prompt for Stability AI"""
-    
-    attributes = get_character_attributes(god_name)
-    
-    # Quality enhancement tokens
-    quality_tokens = """
-    masterpiece, best quality, ultra detailed, 8k uhd, photorealistic,
-    professionally lit, volumetric lighting, ray tracing,
-    epic cinematic composition, award-winning photography,
-    intricate details, sharp focus, depth of field
-    """
-    
-    # Style consistency
-    style_tokens = """
-    in style of Raja Ravi Varma classical Indian art,
-    divine mythological painting, sacred traditional art,
-    culturally authentic, spiritual essence
-    """
-    
-    # Strong negative prompt
-    negative_prompt = """
-    cartoon, anime, sketch, illustration, cgi, 3d render,
-    low quality, blurry, distorted, disfigured, bad anatomy,
-    multiple heads, deformed body, ugly face, bad proportions,
-    modern clothing, sunglasses, phones, cars, buildings, technology,
-    text, watermark, signature, logo, brand names,
-    western symbols, crosses, churches,
-    violence, blood, gore, weapons in aggressive use,
-    extra limbs, missing limbs, cloned face, malformed
-    """
-    
-    positive_prompt = f"""
-    {god_name}, maintaining exact same facial features as reference,
-    {scene_description},
-    {camera_angle},
-    {attributes},
-    ancient sacred Indian mythological setting,
-    divine temple or natural spiritual environment,
-    {quality_tokens},
-    {style_tokens}
-    """
+    prefix, suffix = _positive_prompt_template(god_name, camera_angle)
     
     return {
-        "positive": positive_prompt.strip(),
-        "negative": negative_prompt.strip()
+        "positive": prefix + scene_description + suffix,
+        "negative": NEGATIVE_PROMPT
     }
 
-def generate_image_img2img(scene_prompt, ref_image_path, scene_index, stability_api_key):
+@lru_cache(maxsize=8)
+def _load_ref_bytes(ref_image_path):
+    """Load, resize and JPEG-encode a reference image (memoized per path)"""
+    with PIL.Image.open(ref_image_path) as img:
+        img = img.convert("RGB")
+        img = img.resize(Config.IMAGE_SIZE, PIL.Image.LANCZOS)
+        
+        # JPEG is a fraction of the PNG size and only travels to Stability
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=92)
+        return buf.getvalue()
+
+def preload_reference_images():
+    """Warm the reference image cache for every known character"""
+    for ref_image_path in set(Config.CHARACTER_MAP.values()):
+        try:
+            _load_ref_bytes(ref_image_path)
+        except Exception as e:
+            # Not cached on failure - img2img retries it and fails only that scene
+            logger.warning(f"⚠️ Could not preload {ref_image_path}: {str(e)}")
+
+async def _stream_image_to_file(response, filename):
+    """Write a binary PNG response to disk chunk by chunk"""
+    # The old file may be hardlinked into the cache - don't write through it
+    if os.path.exists(filename):
+        os.unlink(filename)
+    
+    with open(filename, "wb") as f:
+        async for chunk in response.aiter_bytes(65536):
+            f.write(chunk)
+    
+    return filename
+
+async def generate_image_img2img(scene_prompt, ref_image_path, scene_index, stability_api_key):
     """Generate image using img2img with reference"""
     
     # Progressive strength for consistency
@@ -77,22 +135,11 @@ def generate_image_img2img(scene_prompt, ref_image_path, scene_index, stability_
     
     # Load and prepare reference image
     try:
-        with PIL.Image.open(ref_image_path) as img:
-            img = img.convert("RGB")
-            img = img.resize(Config.IMAGE_SIZE, PIL.Image.LANCZOS)
-            
-            # Enhance contrast
-            enhancer = PIL.ImageEnhance.Contrast(img)
-            img = enhancer.enhance(1.1)
-            
-            buf = io.BytesIO()
-            img.save(buf, format="PNG", quality=95)
-            init_image_bytes = buf.getvalue()
+        init_image_bytes = _load_ref_bytes(ref_image_path)
     except Exception as e:
         raise Exception(f"Image preparation failed: {str(e)}")
     
     # Prepare API request
-    files = {"init_image": init_image_bytes}
     data = {
         "init_image_mode": "IMAGE_STRENGTH",
         "image_strength": str(image_strength),
@@ -106,34 +153,29 @@ def generate_image_img2img(scene_prompt, ref_image_path, scene_index, stability_
         "sampler": Config.DEFAULT_SAMPLER,
     }
     
+    files = {"init_image": ("init_image.jpg", init_image_bytes, "image/jpeg")}
+    
     headers = {
         "Authorization": f"Bearer {stability_api_key}",
-        "Accept": "application/json"
+        "Accept": "image/png"
     }
     
     # Make API call
-    response = requests.post(
+    async with _get_client().stream(
+        "POST",
         f"https://api.stability.ai/v1/generation/{Config.STABILITY_MODEL}/image-to-image",
         headers=headers,
         files=files,
-        data=data,
-        timeout=90
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"Stability AI error: {response.text}")
-    
-    # Save image
-    result = response.json()
-    image_bytes = base64.b64decode(result["artifacts"][0]["base64"])
-    filename = f"scene_{scene_index}.png"
-    
-    with open(filename, "wb") as f:
-        f.write(image_bytes)
-    
-    return filename
+        data=data
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise Exception(f"Stability AI error: {response.text}")
+        
+        # Save image
+        return await _stream_image_to_file(response, f"scene_{scene_index}.png")
 
-def generate_image_txt2img(scene_prompt, scene_index, stability_api_key):
+async def generate_image_txt2img(scene_prompt, scene_index, stability_api_key):
     """Generate image using text-to-image (for group scenes)"""
     
     camera_angle = Config.CAMERA_PRESETS[scene_index % len(Config.CAMERA_PRESETS)]
@@ -165,24 +207,17 @@ def generate_image_txt2img(scene_prompt, scene_index, stability_api_key):
     headers = {
         "Authorization": f"Bearer {stability_api_key}",
         "Content-Type": "application/json",
-        "Accept": "application/json"
+        "Accept": "image/png"
     }
     
-    response = requests.post(
+    async with _get_client().stream(
+        "POST",
         f"https://api.stability.ai/v1/generation/{Config.STABILITY_MODEL}/text-to-image",
         headers=headers,
-        json=body,
-        timeout=90
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"Stability AI error: {response.text}")
-    
-    result = response.json()
-    image_bytes = base64.b64decode(result["artifacts"][0]["base64"])
-    filename = f"scene_{scene_index}.png"
-    
-    with open(filename, "wb") as f:
-        f.write(image_bytes)
-    
-    return filename
\ No newline at end of file
+        json=body
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise Exception(f"Stability AI error: {response.text}")
+        
+        return await _stream_image_to_file(response, f"scene_{scene_index}.png")
\ No newline at end of file
@@ -2,21 +2,10 @@
 # Script Generation Service
 # =========================================================
 
-import json
+import orjson
 from openai import OpenAI
 from config import Config
-
-def detect_language(text):
-    """Detect if text is Hindi or English"""
-    if not text:
-        return "en"
-    
-    # Check for Devanagari characters
-    for ch in text:
-        if '\u0900' <= ch <= '\u097F':
-            return "hi"
-    
-    return "en"
+from utils.lang import detect_language
 
 def build_script_prompt(topic, language):
     """Build GPT-4 prompt for script generation"""
@@ -69,9 +58,11 @@ def generate_script(topic, openai_client):
         
         content = response.choices[0].message.content
         
-        # Clean JSON
-        clean_content = content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_content)
+        # Clean JSON (json_object mode normally returns a bare object already)
+        clean_content = content.strip()
+        if not clean_content.startswith("{"):
+            clean_content = clean_content.replace("```json", "").replace("```", "").strip()
+        data = orjson.loads(clean_content)
         
         scenes = []
         
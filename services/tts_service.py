@@ -2,49 +2,172 @@
 # Text-to-Speech Service
 # =========================================================
 
+import os
+import ssl
 import asyncio
+import aiohttp
+import certifi
 import edge_tts
+from xml.sax.saxutils import escape
+from edge_tts.communicate import (
+    WSS_URL, calc_max_mesg_size, connect_id, date_to_string, get_headers_and_data,
+    mkssml, remove_incompatible_characters, split_text_by_byte_length, ssml_headers_plus_data
+)
+from config import Config
+from utils.lang import detect_language
 
-def detect_language_for_tts(text):
-    """Detect language for voice selection"""
-    if not text:
-        return "en"
+# edge-tts opens a new websocket per Communicate. The service accepts several
+# SSML requests on one socket, so keep sockets open per voice and reuse them
+# across scenes. This relies on edge-tts 6.1.10 internals - keep the version pinned.
+_RATE, _VOLUME, _PITCH = "+0%", "+0%", "+0Hz"
+
+_WS_HEADERS = {
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+    "Origin": "chrome-extension://jdiccldimpdaibmpdkjnbmckianbfold",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Accept-Language": "en-US,en;q=0.9",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    " (KHTML, like Gecko) Chrome/91.0.4472.77 Safari/537.36 Edg/91.0.864.41",
+}
+
+_SPEECH_CONFIG = (
+    "Content-Type:application/json; charset=utf-8\r\n"
+    "Path:speech.config\r\n\r\n"
+    '{"context":{"synthesis":{"audio":{"metadataoptions":{'
+    '"sentenceBoundaryEnabled":false,"wordBoundaryEnabled":true},'
+    '"outputFormat":"audio-24khz-48kbitrate-mono-mp3"'
+    "}}}}\r\n"
+)
+
+class _VoiceConnection:
+    """A persistent edge-tts websocket for one voice"""
+    
+    def __init__(self, voice):
+        # Communicate validates and expands the short voice name
+        self.voice = edge_tts.Communicate("", voice).voice
+        self._session = None
+        self._websocket = None
+    
+    async def _connect(self):
+        """Open the websocket and send the one-time speech config"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(trust_env=True)
+        
+        self._websocket = await self._session.ws_connect(
+            f"{WSS_URL}&ConnectionId={connect_id()}",
+            compress=15,
+            receive_timeout=5,
+            headers=_WS_HEADERS,
+            ssl=ssl.create_default_context(cafile=certifi.where())
+        )
+        await self._websocket.send_str(f"X-Timestamp:{date_to_string()}\r\n" + _SPEECH_CONFIG)
+    
+    async def _request_audio(self, text):
+        """Send one text (split if too long) and collect its audio until turn.end"""
+        audio = []
+        parts = split_text_by_byte_length(
+            escape(remove_incompatible_characters(text)),
+            calc_max_mesg_size(self.voice, _RATE, _VOLUME, _PITCH)
+        )
+        
+        for part in parts:
+            await self._websocket.send_str(ssml_headers_plus_data(
+                connect_id(), date_to_string(), mkssml(part, self.voice, _RATE, _VOLUME, _PITCH)
+            ))
+            
+            async for received in self._websocket:
+                if received.type == aiohttp.WSMsgType.TEXT:
+                    headers, _ = get_headers_and_data(received.data)
+                    if headers.get(b"Path") == b"turn.end":
+                        break
+                elif received.type == aiohttp.WSMsgType.BINARY:
+                    header_length = int.from_bytes(received.data[:2], "big")
+                    audio.append(received.data[header_length + 2:])
+                elif received.type == aiohttp.WSMsgType.ERROR:
+                    raise Exception(f"TTS websocket error: {received.data}")
+            else:
+                raise Exception("TTS websocket closed mid-request")
+        
+        if not audio:
+            raise Exception("No audio was received")
+        
+        return b"".join(audio)
     
-    for ch in text:
-        if '\u0900' <= ch <= '\u097F':
-            return "hi"
+    async def _discard(self):
+        """Drop the socket so it is never reused, then close it"""
+        websocket, self._websocket = self._websocket, None
+        if websocket is not None:
+            await websocket.close()
     
-    return "en"
+    async def synthesize(self, text, filename):
+        """Synthesize text to an MP3 file over the connection's socket"""
+        for attempt in range(2):
+            fresh = self._websocket is None or self._websocket.closed
+            if fresh:
+                await self._connect()
+            
+            try:
+                audio = await self._request_audio(text)
+                break
+            except BaseException as e:
+                # An unfinished turn (error, timeout or cancellation) leaves its
+                # frames unread on the socket - the next request would get them
+                await self._discard()
+                # A reused socket may have been dropped while idle - reconnect once
+                if not isinstance(e, Exception) or fresh or attempt:
+                    raise
+        
+        with open(filename, "wb") as f:
+            f.write(audio)
+
+# A fixed pool of connections per voice, shared by every scene and video.
+# Requests queue for a free connection, so all the scenes of a video reuse
+# at most TTS_CONNECTIONS_PER_VOICE handshakes instead of one each.
+# Created lazily because the queues must live on the event loop that uses them
+_POOLS = {}
+
+def _get_pool(voice):
+    """Return the connection pool for a voice"""
+    pool = _POOLS.get(voice)
+    if pool is None:
+        pool = _POOLS[voice] = asyncio.Queue()
+        for _ in range(Config.TTS_CONNECTIONS_PER_VOICE):
+            pool.put_nowait(_VoiceConnection(voice))
+    return pool
 
 def choose_voice(text):
     """Select appropriate voice based on language"""
-    lang = detect_language_for_tts(text)
+    lang = detect_language(text)
     
     if lang == "hi":
         return "hi-IN-MadhurNeural"  # Hindi male voice
     else:
         return "en-IN-PrabhatNeural"  # English Indian male voice
 
-def generate_audio(text, index):
+async def generate_audio_async(text, index):
     """Generate audio using edge-tts"""
     voice = choose_voice(text)
     filename = f"audio_{index}.mp3"
     
-    async def run_tts():
-        communicate = edge_tts.Communicate(text, voice)
-        await communicate.save(filename)
-    
     try:
-        # Get or create event loop
+        # The old file may be hardlinked into the cache - don't write through it
+        if os.path.exists(filename):
+            os.unlink(filename)
+        
+        pool = _get_pool(voice)
+        connection = await pool.get()
+        
         try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Time the request itself, not the wait for a free connection.
+            # On timeout synthesize discards the socket before it goes back
+            await asyncio.wait_for(connection.synthesize(text, filename), timeout=Config.TTS_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise Exception(f"timed out after {Config.TTS_REQUEST_TIMEOUT}s")
+        finally:
+            pool.put_nowait(connection)
         
-        # Run TTS
-        loop.run_until_complete(run_tts())
         return filename
     
     except Exception as e:
-        raise Exception(f"TTS generation failed: {str(e)}")
\ No newline at end of file
+        raise Exception(f"TTS generation failed: {str(e)}")
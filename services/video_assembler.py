@@ -3,148 +3,209 @@
 # =========================================================
 
 import os
-from moviepy import ImageClip, AudioFileClip, concatenate_videoclips
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+import re
+import shutil
+import logging
+import subprocess
+from functools import lru_cache
+import imageio_ffmpeg
 from config import Config
 
-def add_subtitles_to_image(image_path, text):
+logger = logging.getLogger(__name__)
+
+# Prefer the system ffmpeg (packages.txt), fall back to the bundled binary
+FFMPEG_BINARY = shutil.which("ffmpeg") or imageio_ffmpeg.get_ffmpeg_exe()
+FFPROBE_BINARY = shutil.which("ffprobe")
+VIDEO_FPS = 24
+
+# Hardware H.264 encoders in order of preference, with their rate-control
+# and input pixel format args (QSV only takes nv12)
+_HW_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr", "-cq", "23", "-pix_fmt", "yuv420p"],
+    "h264_qsv": ["-global_quality", "23", "-pix_fmt", "nv12"],
+    "h264_videotoolbox": ["-q:v", "65", "-pix_fmt", "yuv420p"],
+    "h264_v4l2m2m": ["-b:v", "5M", "-pix_fmt", "yuv420p"],
+}
+_SOFTWARE_ENCODER = ["-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage", "-pix_fmt", "yuv420p"]
+
+# Lanczos-scale into the video frame, letterboxing if the aspect differs
+_SCALE_FILTER = (
+    f"scale={Config.VIDEO_WIDTH}:{Config.VIDEO_HEIGHT}:force_original_aspect_ratio=decrease:flags=lanczos,"
+    f"pad={Config.VIDEO_WIDTH}:{Config.VIDEO_HEIGHT}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+)
+
+# Detected once per process (None until the first encode)
+_VIDEO_CODEC_ARGS = None
+
+# Subtitles are burned in by libass during the encode: white text with a
+# black outline and drop shadow, bottom-centred and word-wrapped within the
+# side margins (per-line boxes overlap between lines, so no box)
+_CAPTIONS_TEMPLATE = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,{font_size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H5F000000,0,0,0,0,100,100,0,0,1,2,2,2,{margin},{margin},50,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:00.00,9:59:59.99,Default,,0,0,0,,{text}
+"""
+
+def _run_ffmpeg(args):
+    """Run ffmpeg quietly, raising with its stderr on failure"""
+    result = subprocess.run(
+        [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", *args],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+@lru_cache(maxsize=64)
+def _probe_duration_cached(path, mtime_ns, size):
+    """Media duration in seconds; the mtime/size args key out rewritten files"""
+    if FFPROBE_BINARY:
+        output = subprocess.check_output([
+            FFPROBE_BINARY, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path
+        ], text=True)
+        return float(output.strip())
+    
+    # The bundled ffmpeg has no ffprobe - read the header line `ffmpeg -i` prints
+    result = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", path], capture_output=True, text=True)
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        raise Exception(f"Could not read duration of {path}")
+    
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def _probe_duration(path):
+    """Media duration in seconds, probed once per file version"""
+    stat = os.stat(path)
+    return _probe_duration_cached(path, stat.st_mtime_ns, stat.st_size)
+
+def _detect_hw_encoder():
     """
-    Adds text subtitles to the bottom of an image using Pillow.
-    Returns the path to the modified image.
+    Returns the first hardware H.264 encoder that ffmpeg lists and can
+    actually open (a listed encoder may have no device behind it), or None.
     """
     try:
-        img = Image.open(image_path)
+        encoders = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True
+        ).stdout
+    except Exception:
+        return None
+    
+    for codec, params in _HW_ENCODERS.items():
+        if codec not in encoders:
+            continue
         
-        # Font configuration
-        # Try to use a nice font, fallback to default
         try:
-            # Common paths for fonts on standard systems
-            font_path = "Arial" # Default for many systems if handled by PIL
-            if os.name == 'posix': # macOS/Linux
-                if os.path.exists("/System/Library/Fonts/Supplemental/Arial.ttf"):
-                    font_path = "/System/Library/Fonts/Supplemental/Arial.ttf"
-                elif os.path.exists("/Library/Fonts/Arial.ttf"):
-                    font_path = "/Library/Fonts/Arial.ttf"
-                elif os.path.exists("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"):
-                    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-            
-            font = ImageFont.truetype(font_path, Config.SUBTITLE_FONT_SIZE)
+            _run_ffmpeg([
+                "-f", "lavfi", "-i", "color=black:size=256x256:duration=0.1",
+                "-c:v", codec, *params, "-f", "null", "-"
+            ])
+            return codec
         except Exception:
-            font = ImageFont.load_default()
-            
-        # Wrap text
-        lines = textwrap.wrap(text, width=Config.SUBTITLE_MAX_WIDTH)
-        
-        # Calculate text height and position
-        # Get line height using getbbox (more accurate than getsize)
-        try:
-            left, top, right, bottom = font.getbbox("Ay")
-            line_height = bottom - top + 15 # Add some padding
-        except AttributeError:
-             # Fallback for older Pillow versions just in case
-            line_height = Config.SUBTITLE_FONT_SIZE + 15
+            continue
+    
+    return None
 
-        total_text_height = len(lines) * line_height
-        
-        # Position at the bottom with some padding
-        image_width, image_height = img.size
-        y_text = image_height - total_text_height - 50
-        
-        # Draw background for text (optional but good for readability)
-        # Semi-transparent black box
-        box_coords = [
-            (0, y_text - 10),
-            (image_width, image_height - 20)
-        ]
-        
-        # To draw with alpha, we need an RGBA image
-        overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-        draw_overlay = ImageDraw.Draw(overlay)
-        draw_overlay.rectangle(box_coords, fill=(0, 0, 0, 160))
-        
-        img = img.convert("RGBA")
-        img = Image.alpha_composite(img, overlay)
-        img = img.convert("RGB")
-        draw = ImageDraw.Draw(img) # Re-create draw object for RGB image
-        
-        # Draw text
-        for line in lines:
-            # Center text
-            try:
-                # textbbox is available in newer Pillow versions
-                bbox = draw.textbbox((0, 0), line, font=font)
-                text_width = bbox[2] - bbox[0]
-            except AttributeError:
-                 # Fallback
-                 text_width = draw.textlength(line, font=font)
-
-            x_text = (image_width - text_width) / 2
-            
-            # Draw with shadow/outline for better visibility
-            shadow_color = (0, 0, 0)
-            text_color = (255, 255, 255)
-            
-            # Simple shadow
-            draw.text((x_text + 2, y_text + 2), line, font=font, fill=shadow_color)
-            draw.text((x_text, y_text), line, font=font, fill=text_color)
-            
-            y_text += line_height
-            
-        # Save output
-        output_path = f"sub_{os.path.basename(image_path)}"
-        img.save(output_path)
-        return output_path
-        
-    except Exception as e:
-        print(f"Error adding subtitles: {e}")
-        return image_path
+def _video_codec_args():
+    """ffmpeg video codec arguments, using a hardware encoder when available"""
+    global _VIDEO_CODEC_ARGS
+    
+    if _VIDEO_CODEC_ARGS is None:
+        codec = _detect_hw_encoder()
+        if codec:
+            _VIDEO_CODEC_ARGS = ["-c:v", codec, *_HW_ENCODERS[codec]]
+        else:
+            _VIDEO_CODEC_ARGS = _SOFTWARE_ENCODER
+        logger.info(f"Video encoder: {_VIDEO_CODEC_ARGS[1]}")
+    
+    return _VIDEO_CODEC_ARGS
+
+def _write_captions(text, scene_index):
+    """Writes a one-line ASS subtitle file covering the whole scene"""
+    # Braces open ASS override blocks and newlines would break the event line
+    text = " ".join(text.replace("{", "(").replace("}", ")").split())
+    
+    captions_path = f"captions_{scene_index}.ass"
+    with open(captions_path, "w", encoding="utf-8") as f:
+        f.write(_CAPTIONS_TEMPLATE.format(
+            width=Config.VIDEO_WIDTH,
+            height=Config.VIDEO_HEIGHT,
+            font_size=Config.SUBTITLE_FONT_SIZE,
+            margin=Config.SUBTITLE_MARGIN,
+            text=text
+        ))
+    
+    return captions_path
 
-def create_video_clip(image_path, audio_path):
+def create_video_clip(image_path, audio_path, text, scene_index):
     """
-    Creates a video clip from an image and audio file.
-    Returns a moviepy VideoClip object.
+    Prepares one scene for encoding: writes its subtitle file.
+    Returns an (image_path, audio_path, captions_path) tuple for assemble_final_video.
     """
     try:
-        audio = AudioFileClip(audio_path)
-        video = ImageClip(image_path)
-        
-        # Set duration to match audio (MoviePy v2 uses with_ prefix)
-        video = video.with_duration(audio.duration)
-        video = video.with_audio(audio)
-        video = video.with_fps(24)
-        
-        return video
+        return image_path, audio_path, _write_captions(text, scene_index)
     except Exception as e:
         raise Exception(f"Failed to create video clip: {str(e)}")
 
+def _scene_filter(index, captions_path):
+    """Filter graph for one scene: fit the image to the frame, burn in subtitles,
+    and bring the narration to a common audio format"""
+    return (
+        f"[{2 * index}:v]{_SCALE_FILTER},subtitles={captions_path}[v{index}];"
+        f"[{2 * index + 1}:a]aresample=44100,aformat=channel_layouts=stereo[a{index}]"
+    )
+
 def assemble_final_video(clips, output_filename="final_video.mp4"):
     """
-    Concatenates clips into a final video.
+    Encodes all (image_path, audio_path, captions_path) clips in a single
+    ffmpeg pass, joined with the concat filter.
     Returns the path to the output video.
     """
     try:
         if not clips:
             raise ValueError("No clips provided to assemble")
-            
-        final_clip = concatenate_videoclips(clips, method="compose")
-        final_clip.write_videofile(
-            output_filename, 
-            fps=24, 
-            codec="libx264", 
-            audio_codec="aac",
-            threads=4,
-            logger=None # Reduce console spam
-        )
         
-        # Close clips to release resources
-        try:
-            for clip in clips:
-                clip.close()
-            final_clip.close()
-        except:
-            pass
-            
+        # One process for the whole video: no per-scene spawn and codec init,
+        # and x264 threads across the full stream instead of per segment
+        inputs = []
+        filters = []
+        for index, (image_path, audio_path, captions_path) in enumerate(clips):
+            inputs += [
+                # Hold each still for exactly its narration's length
+                "-loop", "1", "-framerate", str(VIDEO_FPS),
+                "-t", f"{_probe_duration(audio_path):.3f}", "-i", image_path,
+                "-i", audio_path
+            ]
+            filters.append(_scene_filter(index, captions_path))
+        
+        streams = "".join(f"[v{index}][a{index}]" for index in range(len(clips)))
+        filters.append(f"{streams}concat=n={len(clips)}:v=1:a=1[v][a]")
+        
+        _run_ffmpeg([
+            *inputs,
+            "-filter_complex", ";".join(filters),
+            "-map", "[v]", "-map", "[a]",
+            *_video_codec_args(),
+            "-c:a", "aac",
+            # Index at the front so playback can start before the download ends
+            "-movflags", "+faststart",
+            output_filename
+        ])
+        
         return output_filename
     except Exception as e:
         raise Exception(f"Failed to assemble final video: {str(e)}")
@@ -0,0 +1,12 @@
+# utils/async_runner.py
+import asyncio
+import threading
+
+# One long-lived event loop shared by every Streamlit rerun, so async
+# setup (loop creation, client sessions) is paid once per process
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="async-runner", daemon=True).start()
+
+def submit_async(coro):
+    """Schedule a coroutine on the background loop and return its Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP)
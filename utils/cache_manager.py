@@ -1,10 +1,61 @@
 # utils/cache_manager.py
 import os
-import hashlib
 import json
 import shutil
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
 from pathlib import Path
 
+# BLAKE3 is SIMD-accelerated; SHA-256 (SHA-NI) is the stdlib fallback
+try:
+    from blake3 import blake3 as _hasher
+except ImportError:
+    from hashlib import sha256 as _hasher
+
+def link_or_copy(src, dst):
+    """
+    Put src at dst without copying data where possible: hardlink, then an
+    in-kernel copy_file_range (a reflink on CoW filesystems), then a plain copy.
+    
+    Linked files share one inode, so never modify either path in place -
+    unlink and rewrite it instead.
+    """
+    if os.path.exists(dst):
+        os.unlink(dst)
+    
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+    
+    shutil.copy(src, dst)
+
+logger = logging.getLogger(__name__)
+
+# Write-behind: metadata rows are committed in batches by a background thread
+_FLUSH_INTERVAL = 0.25  # seconds to keep collecting after the first pending row
+_FLUSH_BATCH = 64
+
 class CacheManager:
     def __init__(self, cache_dir="cache"):
         self.cache_dir = Path(cache_dir)
@@ -13,116 +64,264 @@ class CacheManager:
         # Separate folders for different types
         self.image_cache = self.cache_dir / "images"
         self.audio_cache = self.cache_dir / "audio"
-        self.metadata_file = self.cache_dir / "metadata.json"
+        self.metadata_file = self.cache_dir / "metadata.db"
         
         self.image_cache.mkdir(exist_ok=True)
         self.audio_cache.mkdir(exist_ok=True)
         
-        self._load_metadata()
+        # One connection shared by the UI and the async runner thread
+        self._lock = threading.Lock()
+        self._init_database()
+        
+        # Rows waiting to be written, readable immediately via _pending;
+        # clear_cache bumps the generation so in-flight rows are dropped
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._generation = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name="cache-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self._stop_flusher)
     
-    def _load_metadata(self):
-        """Load cache metadata"""
-        if self.metadata_file.exists():
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
-        else:
-            self.metadata = {}
+    def _init_database(self):
+        """Open the metadata database, removing a legacy metadata.json cache if present"""
+        self._conn = sqlite3.connect(self.metadata_file, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT,
+                size_bytes INTEGER
+            )
+        ''')
+        
+        # Databases created before size tracking lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "size_bytes" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN size_bytes INTEGER")
+        
+        # metadata.json predates the BLAKE3 keys, so none of its entries can
+        # ever be looked up again - delete it and the files it indexed
+        legacy_file = self.cache_dir / "metadata.json"
+        if legacy_file.exists():
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            
+            for entry in legacy.values():
+                directory = self.image_cache if entry.get("type") == "image" else self.audio_cache
+                (directory / entry["filename"]).unlink(missing_ok=True)
+            legacy_file.unlink()
+        
+        # One-off backfill for rows written before sizes were recorded
+        missing = self._conn.execute(
+            "SELECT key, filename, kind FROM entries WHERE size_bytes IS NULL"
+        ).fetchall()
+        for cache_key, filename, kind in missing:
+            cached_path = (self.image_cache if kind == "image" else self.audio_cache) / filename
+            size = cached_path.stat().st_size if cached_path.exists() else 0
+            self._conn.execute("UPDATE entries SET size_bytes=? WHERE key=?", (size, cache_key))
+    
+    def _save_entry(self, cache_key, cached_path, kind, payload):
+        """Queue one metadata row (recording the file's size) for the flusher"""
+        row = (
+            cache_key, cached_path.name, kind,
+            json.dumps(payload, ensure_ascii=False), cached_path.stat().st_size
+        )
+        
+        with self._lock:
+            self._pending[cache_key] = row
+            self._queue.put((self._generation, row))
+    
+    def _drain(self, first=None, timeout=0):
+        """
+        Collect up to a batch of queued rows, waiting at most timeout seconds
+        Returns: (items, stop) - stop is set once the shutdown sentinel is seen
+        """
+        items = [] if first is None else [first]
+        deadline = time.monotonic() + timeout
+        
+        while len(items) < _FLUSH_BATCH:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            
+            if item is None:
+                return items, True
+            items.append(item)
+        
+        return items, False
+    
+    def _write_batch(self, items):
+        """Commit a batch of rows in one transaction (failures are logged, not raised)"""
+        with self._lock:
+            rows = [row for generation, row in items if generation == self._generation]
+            if not rows:
+                return
+            
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                # The files stay on disk; these entries just become cache misses
+                logger.error(f"❌ Cache metadata write failed, dropping {len(rows)} rows: {str(e)}")
+            
+            for row in rows:
+                if self._pending.get(row[0]) is row:
+                    del self._pending[row[0]]
     
-    def _save_metadata(self):
-        """Save cache metadata"""
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, indent=2, ensure_ascii=False)
+    def _flush_loop(self):
+        """Background thread: batch rows as they arrive, until the shutdown sentinel"""
+        while (first := self._queue.get()) is not None:
+            items, stop = self._drain(first, _FLUSH_INTERVAL)
+            self._write_batch(items)
+            if stop:
+                return
+    
+    def _stop_flusher(self):
+        """At exit: let the flusher write everything queued or in hand, then stop"""
+        self._queue.put(None)
+        self._flusher.join(timeout=10)
+    
+    def flush(self):
+        """Write every queued row now (used before stats)"""
+        while True:
+            items, stop = self._drain()
+            if stop:
+                # Leave the shutdown sentinel for the flusher thread
+                self._queue.put(None)
+            if not items:
+                return
+            
+            self._write_batch(items)
     
     def _generate_hash(self, *args):
         """Generate unique hash from arguments"""
         combined = "|".join(str(arg) for arg in args)
-        return hashlib.md5(combined.encode()).hexdigest()
+        # 32 hex chars either way (BLAKE3's prefix matches its 16-byte digest)
+        return _hasher(combined.encode()).hexdigest()[:32]
     
-    def get_cached_image(self, prompt, ref_path, scene_index):
-        """Retrieve cached image if exists"""
-        cache_key = self._generate_hash(prompt, ref_path, scene_index)
+    def image_key(self, prompt, ref_path, scene_index):
+        """Cache key for a generated image"""
+        return self._generate_hash(prompt, ref_path, scene_index)
+    
+    def audio_key(self, text, voice):
+        """Cache key for generated audio"""
+        return self._generate_hash(text, voice)
+    
+    def get_cached_many(self, cache_keys):
+        """
+        Look up many cache keys in one query
+        Returns: {cache_key: cached_path} for entries whose file still exists
+        """
+        cache_keys = list(cache_keys)
+        if not cache_keys:
+            return {}
+        
+        with self._lock:
+            # Rows not yet flushed are answered from memory
+            rows = [self._pending[key][:3] for key in cache_keys if key in self._pending]
+            stored_keys = [key for key in cache_keys if key not in self._pending]
+            
+            if stored_keys:
+                placeholders = ",".join("?" * len(stored_keys))
+                rows += self._conn.execute(
+                    f"SELECT key, filename, kind FROM entries WHERE key IN ({placeholders})",
+                    stored_keys
+                ).fetchall()
         
-        if cache_key in self.metadata:
-            cached_path = self.image_cache / self.metadata[cache_key]["filename"]
+        found = {}
+        for cache_key, filename, kind in rows:
+            cached_path = (self.image_cache if kind == "image" else self.audio_cache) / filename
             
             if cached_path.exists():
-                return str(cached_path)
+                found[cache_key] = str(cached_path)
         
-        return None
+        return found
+    
+    def get_cached_image(self, prompt, ref_path, scene_index):
+        """Retrieve cached image if exists"""
+        cache_key = self.image_key(prompt, ref_path, scene_index)
+        return self.get_cached_many([cache_key]).get(cache_key)
     
     def cache_image(self, image_path, prompt, ref_path, scene_index):
-        """Save image to cache"""
-        cache_key = self._generate_hash(prompt, ref_path, scene_index)
+        """Save image to cache (hardlinked - don't modify image_path in place afterwards)"""
+        cache_key = self.image_key(prompt, ref_path, scene_index)
         filename = f"{cache_key}.png"
         cached_path = self.image_cache / filename
         
-        # Copy image to cache
-        shutil.copy(image_path, cached_path)
+        # Link image into cache
+        link_or_copy(image_path, cached_path)
         
         # Update metadata
-        self.metadata[cache_key] = {
-            "filename": filename,
+        self._save_entry(cache_key, cached_path, "image", {
             "prompt": prompt,
             "ref_path": ref_path,
-            "scene_index": scene_index,
-            "type": "image"
-        }
+            "scene_index": scene_index
+        })
         
-        self._save_metadata()
         return str(cached_path)
     
     def get_cached_audio(self, text, voice):
         """Retrieve cached audio if exists"""
-        cache_key = self._generate_hash(text, voice)
-        
-        if cache_key in self.metadata:
-            cached_path = self.audio_cache / self.metadata[cache_key]["filename"]
-            
-            if cached_path.exists():
-                return str(cached_path)
-        
-        return None
+        cache_key = self.audio_key(text, voice)
+        return self.get_cached_many([cache_key]).get(cache_key)
     
     def cache_audio(self, audio_path, text, voice):
-        """Save audio to cache"""
-        cache_key = self._generate_hash(text, voice)
+        """Save audio to cache (hardlinked - don't modify audio_path in place afterwards)"""
+        cache_key = self.audio_key(text, voice)
         filename = f"{cache_key}.mp3"
         cached_path = self.audio_cache / filename
         
-        # Copy audio to cache
-        shutil.copy(audio_path, cached_path)
+        # Link audio into cache
+        link_or_copy(audio_path, cached_path)
         
         # Update metadata
-        self.metadata[cache_key] = {
-            "filename": filename,
+        self._save_entry(cache_key, cached_path, "audio", {
             "text": text,
-            "voice": voice,
-            "type": "audio"
-        }
+            "voice": voice
+        })
         
-        self._save_metadata()
         return str(cached_path)
     
     def clear_cache(self):
         """Clear all cached files"""
-        shutil.rmtree(self.cache_dir)
-        self.cache_dir.mkdir(exist_ok=True)
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+            self._conn.execute("DELETE FROM entries")
+        
+        shutil.rmtree(self.image_cache)
+        shutil.rmtree(self.audio_cache)
         self.image_cache.mkdir(exist_ok=True)
         self.audio_cache.mkdir(exist_ok=True)
-        self.metadata = {}
-        self._save_metadata()
     
     def get_cache_stats(self):
-        """Get cache statistics"""
-        total_images = len(list(self.image_cache.glob("*.png")))
-        total_audio = len(list(self.audio_cache.glob("*.mp3")))
+        """Get cache statistics (from recorded sizes - no directory walk)"""
+        self.flush()
+        
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries GROUP BY kind"
+            ).fetchall()
+        
+        counts = {kind: (count, size) for kind, count, size in rows}
+        total_images, image_size = counts.get("image", (0, 0))
+        total_audio, audio_size = counts.get("audio", (0, 0))
         
         # Calculate size
-        total_size = sum(f.stat().st_size for f in self.cache_dir.rglob("*") if f.is_file())
+        total_size = image_size + audio_size
+        if self.metadata_file.exists():
+            total_size += self.metadata_file.stat().st_size
         size_mb = total_size / (1024 * 1024)
         
         return {
             "total_images": total_images,
             "total_audio": total_audio,
             "cache_size_mb": round(size_mb, 2)
-        }
\ No newline at end of file
+        }
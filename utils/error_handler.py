@@ -1,5 +1,7 @@
 # utils/error_handler.py
 import time
+import random
+import asyncio
 import logging
 from functools import wraps
 
@@ -10,46 +12,89 @@ def retry_with_exponential_backoff(
     max_retries=3,
     initial_delay=2,
     exponential_base=2,
-    exceptions=(Exception,)
+    exceptions=(Exception,),
+    none_retry_delay=0.0,
+    jitter=True
 ):
     """
     Decorator that retries a function with exponential backoff
-    
+    (works on both plain functions and coroutines)
+
     Example:
     - Attempt 1 fails: wait 2 seconds
     - Attempt 2 fails: wait 4 seconds
     - Attempt 3 fails: wait 8 seconds
+
+    A None result is retried after none_retry_delay instead (no backoff).
+    With jitter, each backoff is scaled by a random 0.5-1.5 factor so
+    concurrent callers don't all retry an API at the same moment.
     """
+    delays = [initial_delay * exponential_base ** i for i in range(max_retries)]
+    
+    def backoff(attempt):
+        return delays[attempt] * random.uniform(0.5, 1.5) if jitter else delays[attempt]
+    
+    def after_attempt(func, attempt, result, error):
+        """
+        Shared retry policy for both wrappers.
+        Returns the seconds to wait before the next try, or None to stop
+        and return result (None when retries are exhausted).
+        """
+        if error is None and result is not None:
+            logger.info(f"✅ {func.__name__} succeeded on attempt {attempt + 1}")
+            return None
+        
+        if error is not None:
+            logger.error(f"❌ {func.__name__} failed: {str(error)}")
+        
+        if attempt == max_retries - 1:
+            if error is not None:
+                logger.error(f"Max retries reached for {func.__name__}")
+            return None
+        
+        # If result is None, treat as failure but retry without backoff
+        if error is None:
+            logger.warning(f"⚠️ {func.__name__} returned None, retrying in {none_retry_delay}s...")
+            return none_retry_delay
+        
+        delay = backoff(attempt)
+        logger.info(f"Retrying in {delay:.1f} seconds...")
+        return delay
+    
     def decorator(func):
+        # The wrappers differ only in awaiting the call and the sleep
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    logger.info(f"Attempting {func.__name__} (try {attempt + 1}/{max_retries})")
+                    try:
+                        result, error = await func(*args, **kwargs), None
+                    except exceptions as e:
+                        result, error = None, e
+                    
+                    delay = after_attempt(func, attempt, result, error)
+                    if delay is None:
+                        return result
+                    await asyncio.sleep(delay)
+                
+                return None
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            delay = initial_delay
-            
             for attempt in range(max_retries):
+                logger.info(f"Attempting {func.__name__} (try {attempt + 1}/{max_retries})")
                 try:
-                    logger.info(f"Attempting {func.__name__} (try {attempt + 1}/{max_retries})")
-                    result = func(*args, **kwargs)
-                    
-                    if result is not None:
-                        logger.info(f"✅ {func.__name__} succeeded on attempt {attempt + 1}")
-                        return result
-                    
-                    # If result is None, treat as failure
-                    if attempt < max_retries - 1:
-                        logger.warning(f"⚠️ {func.__name__} returned None, retrying in {delay}s...")
-                        time.sleep(delay)
-                        delay *= exponential_base
-                    
+                    result, error = func(*args, **kwargs), None
                 except exceptions as e:
-                    logger.error(f"❌ {func.__name__} failed: {str(e)}")
-                    
-                    if attempt < max_retries - 1:
-                        logger.info(f"Retrying in {delay} seconds...")
-                        time.sleep(delay)
-                        delay *= exponential_base
-                    else:
-                        logger.error(f"Max retries reached for {func.__name__}")
-                        return None
+                    result, error = None, e
+                
+                delay = after_attempt(func, attempt, result, error)
+                if delay is None:
+                    return result
+                time.sleep(delay)
             
             return None
         
@@ -0,0 +1,17 @@
+# =========================================================
+# Language Detection
+# =========================================================
+
+import re
+from functools import lru_cache
+
+# Any character from the Devanagari block marks the text as Hindi
+_DEVANAGARI_RE = re.compile(r'[\u0900-\u097F]')
+
+@lru_cache(maxsize=64)
+def detect_language(text):
+    """Detect if text is Hindi or English"""
+    if not text:
+        return "en"
+    
+    return "hi" if _DEVANAGARI_RE.search(text) else "en"
@@ -1,66 +1,129 @@
 # utils/parallel_processor.py
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import asyncio
 import logging
+from utils.async_runner import submit_async
 
 logger = logging.getLogger(__name__)
 
 class ParallelSceneProcessor:
-    def __init__(self, max_workers=3):
+    def __init__(self, max_image_concurrency=4, max_audio_concurrency=8):
         """
-        max_workers=3 means we can generate 3 things at once
-        Don't set too high or you'll hit API rate limits
+        Images and audio run in separate worker pools, so fast TTS calls
+        never sit idle behind slow Stability calls.
+        Don't set max_image_concurrency too high or you'll hit API rate limits
         """
-        self.max_workers = max_workers
+        self.max_image_concurrency = max_image_concurrency
+        self.max_audio_concurrency = max_audio_concurrency
     
-    def process_scenes_parallel(self, scenes, image_generator, audio_generator):
+    def process_scenes_parallel(self, scenes, image_generator, audio_generator, cached_images=None, cached_audio=None):
         """
-        Process multiple scenes in parallel
+        Process all scenes concurrently on the shared background event loop
         
         Args:
             scenes: List of scene dictionaries
-            image_generator: Function to generate images
-            audio_generator: Function to generate audio
+            image_generator: Coroutine function to generate images
+            audio_generator: Coroutine function to generate audio
+            cached_images: Optional {scene_index: image_path} already resolved
+                from cache; those scenes skip image generation entirely
+            cached_audio: Optional {scene_index: audio_path}, same for audio
         
-        Returns:
-            List of results: [(scene_index, image_path, audio_path), ...]
+        Yields:
+            (scene_index, image_path, audio_path) as each scene completes,
+            so callers can build clips while later scenes are still generating
         """
-        results = []
-        
         if not isinstance(scenes, list):
             logger.error(f"❌ process_scenes_parallel expected list of dicts, got {type(scenes)}")
-            return []
+            return
+        
+        completed = queue.Queue()
+        future = submit_async(self._process_all(
+            scenes, image_generator, audio_generator, cached_images or {}, cached_audio or {}, completed.put
+        ))
+        
+        # None marks the end of the stream
+        while (result := completed.get()) is not None:
+            yield result
+        
+        future.result()
+    
+    async def _run_stage(self, kind, generator, jobs, concurrency, timeout, done_queue):
+        """Drain a queue of scenes through a fixed pool of workers"""
+        pending = asyncio.Queue()
+        for job in jobs:
+            pending.put_nowait(job)
+        
+        async def worker():
+            while not pending.empty():
+                index, scene = pending.get_nowait()
+                
+                try:
+                    result = await asyncio.wait_for(generator(scene, index), timeout=timeout)
+                except Exception as e:
+                    logger.error(f"❌ Scene {index} {kind} failed: {str(e)}")
+                    result = None
+                
+                await done_queue.put((index, kind, result))
+        
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(jobs)))))
+    
+    async def _process_all(self, scenes, image_generator, audio_generator, cached_images, cached_audio, emit):
+        """Run the image and audio stages independently and emit each joined scene"""
+        jobs = []
+        for i, scene in enumerate(scenes):
+            if not isinstance(scene, dict):
+                logger.warning(f"⚠️ Skipping invalid scene at index {i}: {type(scene)}")
+                continue
             
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks
-            futures = {}
+            jobs.append((i, scene))
+        
+        done_queue = asyncio.Queue()
+        
+        # Cache hits are ready immediately - only dispatch the misses
+        image_jobs = []
+        audio_jobs = []
+        for index, scene in jobs:
+            if index in cached_images:
+                done_queue.put_nowait((index, "image", cached_images[index]))
+            else:
+                image_jobs.append((index, scene))
             
-            for i, scene in enumerate(scenes):
-                if not isinstance(scene, dict):
-                    logger.warning(f"⚠️ Skipping invalid scene at index {i}: {type(scene)}")
+            if index in cached_audio:
+                done_queue.put_nowait((index, "audio", cached_audio[index]))
+            else:
+                audio_jobs.append((index, scene))
+        
+        # No stage timeout for audio: scenes queue for a pooled TTS socket,
+        # and the TTS service times each request once it holds one
+        stages = asyncio.gather(
+            self._run_stage("image", image_generator, image_jobs, self.max_image_concurrency, 120, done_queue),
+            self._run_stage("audio", audio_generator, audio_jobs, self.max_audio_concurrency, None, done_queue)
+        )
+        
+        # Join: a scene is ready once both its image and audio have arrived,
+        # or as soon as either half fails - no point waiting on the other
+        partial = {}
+        failed = set()
+        
+        try:
+            for _ in range(2 * len(jobs)):
+                index, kind, value = await done_queue.get()
+                if index in failed:
                     continue
-                    
-                # Submit image generation
-                img_future = executor.submit(image_generator, scene, i)
-                # Submit audio generation
-                audio_future = executor.submit(audio_generator, scene, i)
                 
-                futures[i] = {
-                    "image": img_future,
-                    "audio": audio_future,
-                    "scene": scene
-                }
+                if value is None:
+                    failed.add(index)
+                    partial.pop(index, None)
+                    emit((index, None, None))
+                    continue
+                
+                partial.setdefault(index, {})[kind] = value
+                
+                if len(partial[index]) == 2:
+                    parts = partial.pop(index)
+                    logger.info(f"✅ Scene {index} completed")
+                    emit((index, parts["image"], parts["audio"]))
             
-            # Collect results as they complete
-            for scene_index in sorted(futures.keys()):
-                try:
-                    img_path = futures[scene_index]["image"].result(timeout=120)
-                    audio_path = futures[scene_index]["audio"].result(timeout=60)
-                    
-                    results.append((scene_index, img_path, audio_path))
-                    logger.info(f"✅ Scene {scene_index} completed")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Scene {scene_index} failed: {str(e)}")
-                    results.append((scene_index, None, None))
-        
-        return results
\ No newline at end of file
+            await stages
+        finally:
+            emit(None)
@@ -1,34 +1,63 @@
 # utils/rate_limiter.py
 import sqlite3
 import hashlib
+import time
+import atexit
+import threading
 from datetime import datetime
 import os
 
+SECONDS_PER_DAY = 86400
+
 class RateLimiter:
+    """
+    Token-bucket limiter: each user holds up to max_videos_per_day tokens,
+    refilled continuously over a day. Buckets live in memory and are only
+    written to SQLite when a token is spent.
+    """
     def __init__(self, db_path="data/rate_limits.db", max_videos_per_day=3):
         self.db_path = db_path
         self.max_videos = max_videos_per_day
+        self.refill_rate = max_videos_per_day / SECONDS_PER_DAY
+        
+        # user_key -> (tokens, last_refill)
+        self._buckets = {}
         
         # Create data directory if it doesn't exist
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        # One autocommit connection for the limiter's lifetime, shared across
+        # Streamlit's script threads behind a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Reentrant: reserve() holds it across the bucket load and the write
+        self._lock = threading.RLock()
+        atexit.register(self._conn.close)
+        
         self._init_database()
     
     def _init_database(self):
         """Create the database table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS usage (
                 user_key TEXT PRIMARY KEY,
                 count INTEGER NOT NULL,
                 date TEXT NOT NULL,
+                tokens REAL,
+                last_refill REAL,
                 last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Databases created before the token bucket lack its columns
+        cursor.execute("PRAGMA table_info(usage)")
+        columns = {row[1] for row in cursor.fetchall()}
+        for column in ("tokens", "last_refill"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE usage ADD COLUMN {column} REAL")
     
     def get_user_key(self, identifier):
         """Generate a unique hash for the user"""
@@ -36,69 +65,94 @@ class RateLimiter:
         raw = f"{identifier}-{today}"
         return hashlib.sha256(raw.encode()).hexdigest()
     
+    def _load_bucket(self, user_key, now):
+        """Read a user's bucket from disk, or start a full one"""
+        with self._lock:
+            result = self._conn.execute(
+                "SELECT tokens, last_refill, count, date FROM usage WHERE user_key=?", (user_key,)
+            ).fetchone()
+        
+        if not result:
+            return (float(self.max_videos), now)
+        
+        tokens, last_refill, count, stored_date = result
+        if tokens is not None:
+            return (tokens, last_refill)
+        
+        # Row from the old day-counter schema - seed from today's count
+        today = datetime.now().date().isoformat()
+        used = count if stored_date == today else 0
+        return (float(max(0, self.max_videos - used)), now)
+    
+    def _available_tokens(self, user_key, now):
+        """Tokens in the user's bucket after refilling up to now"""
+        if user_key not in self._buckets:
+            self._buckets[user_key] = self._load_bucket(user_key, now)
+        
+        tokens, last_refill = self._buckets[user_key]
+        return min(self.max_videos, tokens + (now - last_refill) * self.refill_rate)
+    
     def check_limit(self, user_key):
         """
-        Check if user has exceeded daily limit
+        Check if user has exceeded daily limit (read-only)
         Returns: (can_proceed: bool, current_count: int, remaining: int)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        today = datetime.now().date().isoformat()
+        tokens = self._available_tokens(user_key, time.time())
+        remaining = int(tokens)
         
-        cursor.execute("SELECT count, date FROM usage WHERE user_key=?", (user_key,))
-        result = cursor.fetchone()
-        
-        if result:
-            count, stored_date = result
-            
-            if stored_date == today:
-                # Same day - check limit
-                remaining = self.max_videos - count
-                can_proceed = count < self.max_videos
-                conn.close()
-                return can_proceed, count, remaining
-            else:
-                # New day - reset counter
-                cursor.execute(
-                    "UPDATE usage SET count=0, date=?, last_updated=CURRENT_TIMESTAMP WHERE user_key=?",
-                    (today, user_key)
-                )
-                conn.commit()
-                conn.close()
-                return True, 0, self.max_videos
-        else:
-            # New user - create entry
-            cursor.execute(
-                "INSERT INTO usage (user_key, count, date) VALUES (?, 0, ?)",
-                (user_key, today)
-            )
-            conn.commit()
-            conn.close()
-            return True, 0, self.max_videos
+        return remaining >= 1, self.max_videos - remaining, remaining
     
-    def increment_usage(self, user_key):
-        """Increment the usage count for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "UPDATE usage SET count = count + 1, last_updated=CURRENT_TIMESTAMP WHERE user_key=?",
-            (user_key,)
+    def _persist(self, user_key, tokens, now, count_delta):
+        """Write a user's bucket and adjust today's video count in one UPSERT"""
+        today = datetime.now().date().isoformat()
+        
+        self._conn.execute(
+            """
+            INSERT INTO usage (user_key, count, date, tokens, last_refill) VALUES (?, max(?, 0), ?, ?, ?)
+            ON CONFLICT(user_key) DO UPDATE SET
+                count = max(CASE WHEN date = excluded.date THEN count ELSE 0 END + ?, 0),
+                date = excluded.date,
+                tokens = excluded.tokens,
+                last_refill = excluded.last_refill,
+                last_updated = CURRENT_TIMESTAMP
+            """,
+            (user_key, count_delta, today, tokens, now, count_delta)
         )
+    
+    def reserve(self, user_key):
+        """
+        Atomically check the limit and spend a token if one is available
+        Returns: (granted: bool, current_count: int, remaining: int)
+        """
+        with self._lock:
+            now = time.time()
+            tokens = self._available_tokens(user_key, now)
+            
+            if tokens < 1:
+                return False, self.max_videos - int(tokens), int(tokens)
+            
+            tokens -= 1
+            self._buckets[user_key] = (tokens, now)
+            self._persist(user_key, tokens, now, 1)
         
-        conn.commit()
-        conn.close()
+        return True, self.max_videos - int(tokens), int(tokens)
+    
+    def release(self, user_key):
+        """Refund a reserved token when the video could not be created"""
+        with self._lock:
+            now = time.time()
+            tokens = min(self.max_videos, self._available_tokens(user_key, now) + 1)
+            self._buckets[user_key] = (tokens, now)
+            self._persist(user_key, tokens, now, -1)
     
     def get_stats(self):
         """Get usage statistics (for admin dashboard)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         today = datetime.now().date().isoformat()
         
-        cursor.execute("SELECT COUNT(*), SUM(count) FROM usage WHERE date=?", (today,))
-        result = cursor.fetchone()
-        
-        conn.close()
+        with self._lock:
+            result = self._conn.execute(
+                "SELECT COUNT(*), SUM(count) FROM usage WHERE date=?", (today,)
+            ).fetchone()
         
         unique_users = result[0] if result[0] else 0
         total_videos = result[1] if result[1] else 0
@@ -106,4 +160,4 @@ class RateLimiter:
         return {
             "unique_users_today": unique_users,
             "total_videos_today": total_videos
-        }
\ No newline at end of file
+        }
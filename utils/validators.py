@@ -2,26 +2,34 @@
 # Input Validators
 # =========================================================
 
+import re
+
+# At most 200 characters and at least 5 once surrounding whitespace is
+# stripped - checked in a single regex pass (any characters are allowed)
+_TOPIC_RE = re.compile(r"(?=.{0,200}\Z)\s*\S.{3,}\S\s*\Z", re.DOTALL)
+
+PROHIBITED_KEYWORDS = [
+    "explicit", "violence", "gore", "porn", "nsfw",
+    "kill", "murder", "death", "blood"
+]
+
+# Substring match (no word boundaries) so "killing" or "bloody" still match
+_PROHIBITED_RE = re.compile("|".join(map(re.escape, PROHIBITED_KEYWORDS)), re.IGNORECASE)
+
 def validate_topic(topic):
     """
     Validate user input topic
     Returns: (is_valid: bool, error_message: str)
     """
-    if not topic or len(topic.strip()) < 5:
-        return False, "⚠️ Topic must be at least 5 characters long"
-    
-    if len(topic) > 200:
+    if not topic or not _TOPIC_RE.match(topic):
+        # Slow path only on failure: work out which rule was broken
+        if not topic or len(topic.strip()) < 5:
+            return False, "⚠️ Topic must be at least 5 characters long"
+        
         return False, "⚠️ Topic too long (maximum 200 characters)"
     
     # Check for prohibited content
-    prohibited_keywords = [
-        "explicit", "violence", "gore", "porn", "nsfw",
-        "kill", "murder", "death", "blood"
-    ]
-    
-    topic_lower = topic.lower()
-    for keyword in prohibited_keywords:
-        if keyword in topic_lower:
-            return False, "⚠️ Content policy violation. Please use respectful themes."
+    if _PROHIBITED_RE.search(topic):
+        return False, "⚠️ Content policy violation. Please use respectful themes."
     
     return True, ""
\ No newline at end of file